@@ -3,11 +3,18 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from datetime import datetime
-from data_ingester import DataIngester
+from data_ingester import DataIngester, REVIEW_COLUMNS
 from review_analyzer import ReviewAnalyzer
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet
 import io
+import os
+import re
+import html
+import hashlib
+import tempfile
+from pathlib import Path
+from itertools import chain
 
 st.sidebar.image('customer-review-4396641_1280.png')
 
@@ -30,11 +37,157 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# On-disk cache of analyzed DataFrames, shared across server restarts
+CACHE_DIR = Path('.cache')
+# Bump whenever ingestion or analysis output changes so stale cache files are not served
+ANALYSIS_CACHE_VERSION = 5
+
+# Lone UTF-16 surrogates (from "\ud83d" escapes the stdlib json parser accepts) cannot be
+# encoded as UTF-8, so parquet and Arrow-backed pandas strings reject them
+_SURROGATE_RE = re.compile('[\ud800-\udfff]')
+
+@st.cache_data(show_spinner=False)
+def _ingest(data_key, filename, _ingester, _data):
+    """Parse raw upload bytes into normalized reviews (cached by content hash)"""
+    buffer = io.BytesIO(_data)
+    buffer.name = filename
+    return _ingester.ingest_file(buffer)
+
+def _replace_surrogates(raw_reviews):
+    """Review columns with lone surrogates replaced by U+FFFD, which is what the UI and exports show"""
+    cleaned = dict(raw_reviews)
+    for name in REVIEW_COLUMNS:
+        values = raw_reviews[name]
+        if any(_SURROGATE_RE.search(value) for value in values):
+            cleaned[name] = [_SURROGATE_RE.sub('\ufffd', value) for value in values]
+    return cleaned
+
+@st.cache_data(show_spinner=False)
+def _analyze(data_key, _analyzer, _raw_reviews):
+    """Run the NLP analysis once per distinct input"""
+    cache_path = CACHE_DIR / f'v{ANALYSIS_CACHE_VERSION}-{data_key}.parquet'
+    if cache_path.exists():
+        try:
+            df = pd.read_parquet(cache_path)
+            # Parquet hands list columns back as arrays
+            for col in ('topics', 'problems', 'suggestions'):
+                df[col] = df[col].map(list)
+            return df
+        except Exception as e:
+            print(f"Ignoring unreadable analysis cache {cache_path}: {e}")
+
+    # analyze_batch spreads large batches across CPU cores itself
+    df = _analyzer.analyze_batch(_replace_surrogates(_raw_reviews))
+    # Counts and ratings fit comfortably in 32-bit columns
+    df = df.astype({'word_count': 'int32', 'char_count': 'int32', 'rating_num': 'float32'})
+    # Low-cardinality labels as categoricals so equality filters compare int codes
+    for col in ('sentiment', 'length_category'):
+        df[col] = df[col].astype('category')
+
+    tmp_path = None
+    try:
+        CACHE_DIR.mkdir(exist_ok=True)
+        # Write to a unique temporary file and rename it into place, so other sessions or
+        # server processes never read a half-written cache file
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.parquet.tmp')
+        with os.fdopen(fd, 'wb') as tmp:
+            df.to_parquet(tmp, index=False, compression='zstd')
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        print(f"Could not write analysis cache {cache_path}: {e}")
+        if tmp_path is not None:
+            Path(tmp_path).unlink(missing_ok=True)
+    return df
+
+def _flatten(col):
+    """Concatenate a column of lists into one flat list"""
+    return list(chain.from_iterable(col.values))
+
+@st.cache_data(show_spinner=False)
+def _precompute(data_key, _df):
+    """Compute every dashboard aggregate in one pass per input"""
+    sentiment_counts = _df['sentiment'].value_counts()
+    all_topics = _flatten(_df['topics'])
+    all_problems = _flatten(_df['problems'])
+    all_suggestions = _flatten(_df['suggestions'])
+    rating_filled = _df['rating_num'].fillna(1).to_numpy()
+    return {
+        'sentiment_counts': sentiment_counts,
+        'pos_count': int(sentiment_counts.get('positive', 0)),
+        'neg_count': int(sentiment_counts.get('negative', 0)),
+        'neu_count': int(sentiment_counts.get('neutral', 0)),
+        'avg_rating': _df['rating_num'].dropna().mean(),
+        'rating_counts': _df['rating_num'].dropna().round().value_counts().sort_index(),
+        'rating_sentiment': pd.crosstab(_df['rating_num'], _df['sentiment']),
+        'topic_counts': pd.Series(all_topics, dtype=object).value_counts(),
+        'problem_counts': pd.Series(all_problems, dtype=object).value_counts(),
+        # First-seen order, de-duplicated in C
+        'unique_suggestions': pd.unique(pd.Series(all_suggestions, dtype=object)),
+        # Boolean row masks for the discrete sentiment/rating filters
+        'rating_masks': {k: rating_filled >= k for k in range(1, 6)},
+        'sentiment_masks': {s: (_df['sentiment'] == s).to_numpy()
+                            for s in ('positive', 'negative', 'neutral')},
+    }
+
+@st.cache_data(show_spinner=False)
+def _to_csv_bytes(data_key, _df):
+    """Serialize the analyzed data to CSV once per input"""
+    return _df.to_csv(index=False).encode('utf-8')
+
+@st.cache_data(show_spinner=False)
+def _to_parquet_bytes(data_key, _df):
+    """Serialize the analyzed data to zstd-compressed Parquet once per input"""
+    buffer = io.BytesIO()
+    _df.to_parquet(buffer, index=False, compression='zstd')
+    return buffer.getvalue()
+
+@st.cache_data(show_spinner=False)
+def _sentiment_pie(values, names):
+    """Sentiment pie chart, cached on the (tiny) count tuples"""
+    return px.pie(values=values, names=names, title="Sentiment Distribution", hole=0.3)
+
+@st.cache_data(show_spinner=False)
+def _rating_histogram(values, ratings):
+    """Rating distribution from pre-binned counts, so the browser gets 5 bars, not N points"""
+    fig = px.bar(x=ratings, y=values, title="Rating Distribution",
+                 labels={'x': 'Rating', 'y': 'count'})
+    fig.update_xaxes(dtick=1)
+    return fig
+
+@st.cache_data(show_spinner=False)
+def _rating_sentiment_bar(data_key, _rating_sentiment):
+    """Stacked sentiment-by-rating bars, cached per input"""
+    fig = px.bar(_rating_sentiment, title="Sentiment by Rating",
+                 labels={'rating_num': 'Rating', 'value': 'Reviews'})
+    fig.update_xaxes(dtick=1)
+    return fig
+
+@st.cache_data(show_spinner=False)
+def _count_bar(values, labels, title):
+    """Horizontal top-N bar chart, cached on the (tiny) count tuples"""
+    fig = px.bar(
+        x=values,
+        y=labels,
+        orientation='h',
+        text=values,
+        title=title
+    )
+    fig.update_traces(textposition="outside")
+    return fig
+
+# ASCII punctuation Markdown (or Streamlit's emoji/LaTeX extensions) could interpret
+_MARKDOWN_SPECIAL_RE = re.compile(r'([\\`*_{}\[\]()#+\-.!|>~$:])')
+
+def _md_escape(value):
+    """Show user-supplied text literally inside HTML-enabled Markdown"""
+    return _MARKDOWN_SPECIAL_RE.sub(r'\\\1', html.escape(str(value), quote=False))
+
 class ReviewDashboard:
     def __init__(self):
         self.ingester = DataIngester()
         self.analyzer = ReviewAnalyzer()
-    
+        self.data_key = None
+
     def render_upload_section(self):
         """File upload + JSON paste"""
         st.sidebar.title("Upload or Paste Reviews")
@@ -54,26 +207,35 @@ class ReviewDashboard:
     def process_input(self, uploaded_file, pasted_json):
         """Process uploaded file or pasted JSON"""
         if uploaded_file:
-            raw_reviews = self.ingester.ingest_file(uploaded_file)
+            data, filename = uploaded_file.getvalue(), uploaded_file.name
         elif pasted_json.strip():
-            raw_reviews = self.ingester.ingest_file(io.StringIO(pasted_json))
+            data, filename = pasted_json.encode('utf-8'), 'pasted.json'
         else:
             return None
-        
-        if not raw_reviews:
+
+        # Cache key covers the raw bytes and the format they are parsed as, so reruns
+        # with the same input hit the cache but the same bytes as .txt and .json do not collide
+        file_format = Path(filename).suffix.lower().lstrip('.')
+        self.data_key = f"{hashlib.sha256(data).hexdigest()}-{file_format}"
+        raw_reviews = _ingest(self.data_key, filename, self.ingester, data)
+
+        if not raw_reviews['text']:
             st.error("No valid reviews found.")
             return None
-        
+
         with st.spinner("Analyzing reviews..."):
-            df = self.analyzer.analyze_batch(raw_reviews)
+            df = _analyze(self.data_key, self.analyzer, raw_reviews)
             return df
     
     def create_dashboard(self, df):
         """Main dashboard layout"""
         st.title("AI-Powered Customer Review Insights")
-        
+
+        # Aggregates shared by every tab, computed once per input
+        agg = _precompute(self.data_key, df)
+
         # Key metrics
-        self.render_metrics(df)
+        self.render_metrics(df, agg)
         
         # Main tabs
         tab1, tab2, tab3, tab4, tab5 = st.tabs([
@@ -82,172 +244,186 @@ class ReviewDashboard:
         ])
         
         with tab1:
-            self.render_overview(df)
+            self.render_overview(df, agg)
         with tab2:
-            self.render_sentiment_analysis(df)
+            self.render_sentiment_analysis(df, agg)
         with tab3:
-            self.render_topics_problems(df)
+            self.render_topics_problems(df, agg)
         with tab4:
             self.render_review_browser(df)
         with tab5:
-            self.render_export(df)
+            self.render_export(df, agg)
     
-    def render_metrics(self, df):
+    def render_metrics(self, df, agg):
         """Display key metrics"""
         col1, col2, col3, col4, col5 = st.columns(5)
         
         with col1:
             st.metric("Total Reviews", len(df))
         with col2:
-            positive = len(df[df['sentiment'] == 'positive'])
-            st.metric("Positive", positive)
+            st.metric("Positive", agg['pos_count'])
         with col3:
-            negative = len(df[df['sentiment'] == 'negative'])
-            st.metric("Negative", negative)
+            st.metric("Negative", agg['neg_count'])
         with col4:
-            neutral = len(df[df['sentiment'] == 'neutral'])
-            st.metric("Neutral", neutral)
+            st.metric("Neutral", agg['neu_count'])
         with col5:
-            avg_rating = df['rating_num'].dropna().mean()
+            avg_rating = agg['avg_rating']
             st.metric("Avg Rating", f"{avg_rating:.1f}/5" if not pd.isna(avg_rating) else "N/A")
     
-    def render_overview(self, df):
+    def render_overview(self, df, agg):
         """Overview tab with charts"""
         col1, col2 = st.columns(2)
         
         with col1:
-            sentiment_counts = df['sentiment'].value_counts()
-            fig = px.pie(values=sentiment_counts.values, names=sentiment_counts.index,
-                         title="Sentiment Distribution", hole=0.3)
+            sentiment_counts = agg['sentiment_counts']
+            fig = _sentiment_pie(tuple(sentiment_counts.values.tolist()),
+                                 tuple(sentiment_counts.index.astype(str)))
             st.plotly_chart(fig, use_container_width=True)
         
         with col2:
-            fig = px.histogram(df, x='rating_num', nbins=5,
-                               title="Rating Distribution", labels={'rating_num': 'Rating'})
-            fig.update_xaxes(dtick=1)
+            rating_counts = agg['rating_counts']
+            if not rating_counts.empty:
+                fig = _rating_histogram(tuple(rating_counts.values.tolist()),
+                                        tuple(rating_counts.index.tolist()))
+                st.plotly_chart(fig, use_container_width=True)
+            else:
+                st.info("No ratings found.")
+
+        if not agg['rating_sentiment'].empty:
+            fig = _rating_sentiment_bar(self.data_key, agg['rating_sentiment'])
             st.plotly_chart(fig, use_container_width=True)
     
-    def render_sentiment_analysis(self, df):
+    @st.fragment
+    def render_sentiment_analysis(self, df, agg):
         """Sentiment analysis details"""
         st.subheader("Sentiment Analysis")
         
         sentiment_filter = st.selectbox("Filter by Sentiment", ["All", "Positive", "Negative", "Neutral"])
         rating_filter = st.slider("Minimum Rating", 1, 5, 1)
         
-        filtered_df = df[df['rating_num'].fillna(1) >= rating_filter]
+        mask = agg['rating_masks'][rating_filter]
         if sentiment_filter != "All":
-            filtered_df = filtered_df[filtered_df['sentiment'] == sentiment_filter.lower()]
+            mask = mask & agg['sentiment_masks'][sentiment_filter.lower()]
+        filtered_df = df[mask]
         
-        for _, row in filtered_df.iterrows():
-            with st.expander(f"{row['review_id']} - {row.get('date', 'No date')} - Rating: {row['rating_num']}/5"):
-                self.render_review_detail(row)
+        self.render_review_table(filtered_df, f"sentiment_table-{self.data_key}-{sentiment_filter}-{rating_filter}")
     
-    def render_topics_problems(self, df):
+    def render_topics_problems(self, df, agg):
         """Topics, Problems (with charts) + Suggestions (list)"""
         col1, col2 = st.columns(2)
-        
+
         with col1:
             st.subheader("Most Discussed Topics")
-            all_topics = []
-            for topics in df['topics']:
-                all_topics.extend(topics)
-            if all_topics:
-                topic_counts = pd.Series(all_topics).value_counts().head(10)
-                fig = px.bar(
-                    x=topic_counts.values,
-                    y=topic_counts.index,
-                    orientation='h',
-                    text=topic_counts.values,
-                    title="Top Topics"
-                )
-                fig.update_traces(textposition="outside")
+            if not agg['topic_counts'].empty:
+                topic_counts = agg['topic_counts'].head(10)
+                fig = _count_bar(tuple(topic_counts.values.tolist()),
+                                 tuple(topic_counts.index), "Top Topics")
                 st.plotly_chart(fig, use_container_width=True)
             else:
                 st.info("No topics extracted.")
         
         with col2:
             st.subheader("Top Problems Identified")
-            all_problems = []
-            for problems in df['problems']:
-                all_problems.extend(problems)
-            if all_problems:
-                problem_counts = pd.Series(all_problems).value_counts().head(10)
-                fig = px.bar(
-                    x=problem_counts.values,
-                    y=problem_counts.index,
-                    orientation='h',
-                    text=problem_counts.values,
-                    title="Top Problems"
-                )
-                fig.update_traces(textposition="outside")
+            if not agg['problem_counts'].empty:
+                problem_counts = agg['problem_counts'].head(10)
+                fig = _count_bar(tuple(problem_counts.values.tolist()),
+                                 tuple(problem_counts.index), "Top Problems")
                 st.plotly_chart(fig, use_container_width=True)
             else:
                 st.info("No problems detected.")
         
         st.subheader("Customer Suggestions")
-        all_suggestions = []
-        for suggestions in df['suggestions']:
-            all_suggestions.extend(suggestions)
-        if all_suggestions:
-            for i, suggestion in enumerate(set(all_suggestions), 1):
+        if len(agg['unique_suggestions']):
+            for i, suggestion in enumerate(agg['unique_suggestions'], 1):
                 st.write(f"{i}. {suggestion}")
         else:
             st.info("No suggestions found.")
 
     
+    @st.fragment
     def render_review_browser(self, df):
         """Review browser tab"""
         st.subheader("Review Browser")
-        search_term = st.text_input("Search reviews")
-        
-        if search_term:
-            filtered_df = df[df['text'].str.contains(search_term, case=False, na=False)]
+        search_term = st.text_input("Search reviews", key="search")
+
+        if len(search_term) >= 3:
+            # Reuse the last mask when only an unrelated widget triggered the rerun
+            search_key = (self.data_key, search_term)
+            cached = st.session_state.get("search_mask")
+            if cached is not None and cached[0] == search_key:
+                mask = cached[1]
+            else:
+                mask = df['text'].str.contains(re.escape(search_term), case=False,
+                                               na=False, regex=True).to_numpy()
+                st.session_state["search_mask"] = (search_key, mask)
+            filtered_df = df[mask]
         else:
+            search_term = ""
             filtered_df = df
         
-        for _, row in filtered_df.iterrows():
-            with st.expander(f"Review {row['review_id']} - Rating: {row['rating_num']}/5"):
-                self.render_review_detail(row)
+        self.render_review_table(filtered_df, f"browser_table-{self.data_key}-{search_term}")
     
+    def render_review_table(self, filtered_df, key):
+        """
+        Selectable review table; details are rendered for the selected row only
+
+        The key should encode the filter state, so a selection made on one
+        filtered frame is never applied to another.
+        """
+        event = st.dataframe(
+            filtered_df[['review_id', 'date', 'rating_num', 'sentiment']],
+            on_select='rerun',
+            selection_mode='single-row',
+            hide_index=True,
+            use_container_width=True,
+            key=key
+        )
+        selected = event.selection.rows
+        if selected and selected[0] < len(filtered_df):
+            self.render_review_detail(filtered_df.iloc[selected[0]].to_dict())
+        else:
+            st.caption("Select a review to see its details.")
+
     def render_review_detail(self, row):
-        """Render individual review details"""
-        col1, col2 = st.columns(2)
-        with col1:
-            st.write(f"**Date:** {row.get('date', 'N/A')}")
-            st.write(f"**Rating:** {row.get('rating_text', 'N/A')} ({row['rating_num']}/5)")
-            st.write(f"**Sentiment:** <span class='{row['sentiment']}'>{row['sentiment'].upper()}</span>",
-                     unsafe_allow_html=True)
-        with col2:
-            st.write(f"**Words:** {row['word_count']} ({row['length_category']})")
-            st.write(f"**Characters:** {row['char_count']}")
-            st.write(f"**Has Rating:** {'Yes' if row['has_rating'] else 'No'}")
-        
-        st.write("**Review Text:**")
-        st.write(row['text'])
+        """Render individual review details as a single Markdown block"""
+        # Only the sentiment <span> is HTML; every review-derived field is escaped
+        lines = [
+            f"**Date:** {_md_escape(row.get('date', 'N/A'))}",
+            f"**Rating:** {_md_escape(row.get('rating_text', 'N/A'))} ({row['rating_num']}/5)",
+            f"**Sentiment:** <span class='{row['sentiment']}'>{row['sentiment'].upper()}</span>",
+            f"**Words:** {row['word_count']} ({row['length_category']})",
+            f"**Characters:** {row['char_count']}",
+            f"**Has Rating:** {'Yes' if row['has_rating'] else 'No'}",
+            "**Review Text:**",
+            _md_escape(row['text']),
+        ]
         
         if row['topics']:
-            st.write("**Topics Mentioned:**")
-            st.write(", ".join(row['topics']))
+            lines.append("**Topics Mentioned:**")
+            lines.append(", ".join(_md_escape(topic) for topic in row['topics']))
         
         if row['problems']:
-            st.write("**Identified Problems:**")
-            for problem in row['problems']:
-                st.write(f"- {problem}")
+            lines.append("**Identified Problems:**")
+            lines.append("\n".join(f"- {_md_escape(problem)}" for problem in row['problems']))
         
         if row['suggestions']:
-            st.write("**Customer Suggestions:**")
-            for suggestion in row['suggestions']:
-                st.write(f"- {suggestion}")
+            lines.append("**Customer Suggestions:**")
+            lines.append("\n".join(f"- {_md_escape(suggestion)}" for suggestion in row['suggestions']))
+        
+        st.markdown("\n\n".join(lines), unsafe_allow_html=True)
     
-    def render_export(self, df):
+    def render_export(self, df, agg):
         """Data export tab"""
         st.subheader("Export Analyzed Data")
         st.dataframe(df[['review_id', 'date', 'rating_text', 'rating_num',
                          'sentiment', 'word_count', 'length_category']].head(), use_container_width=True)
         
-        # CSV export
-        csv = df.to_csv(index=False).encode('utf-8')
+        # CSV / Parquet export
+        csv = _to_csv_bytes(self.data_key, df)
         st.download_button("Download Full Data (CSV)", csv, "review_analysis.csv", "text/csv")
+        parquet = _to_parquet_bytes(self.data_key, df)
+        st.download_button("Download Full Data (Parquet)", parquet, "review_analysis.parquet",
+                           "application/vnd.apache.parquet")
         
         # PDF export
         if st.button("Download Summary Report (PDF)"):
@@ -258,18 +434,16 @@ class ReviewDashboard:
             story.append(Paragraph("Customer Review Analysis Report", styles['Title']))
             story.append(Spacer(1, 12))
             story.append(Paragraph(f"Total Reviews: {len(df)}", styles['Normal']))
-            story.append(Paragraph(f"Average Rating: {df['rating_num'].mean():.1f}/5", styles['Normal']))
-            story.append(Paragraph(f"Positive: {len(df[df['sentiment']=='positive'])}", styles['Normal']))
-            story.append(Paragraph(f"Negative: {len(df[df['sentiment']=='negative'])}", styles['Normal']))
-            story.append(Paragraph(f"Neutral: {len(df[df['sentiment']=='neutral'])}", styles['Normal']))
+            avg_rating = agg['avg_rating']
+            story.append(Paragraph(f"Average Rating: {avg_rating:.1f}/5" if not pd.isna(avg_rating)
+                                   else "Average Rating: N/A", styles['Normal']))
+            story.append(Paragraph(f"Positive: {agg['pos_count']}", styles['Normal']))
+            story.append(Paragraph(f"Negative: {agg['neg_count']}", styles['Normal']))
+            story.append(Paragraph(f"Neutral: {agg['neu_count']}", styles['Normal']))
             story.append(Spacer(1, 12))
             story.append(Paragraph("Top Problems:", styles['Heading2']))
-            all_problems = []
-            for problems in df['problems']:
-                all_problems.extend(problems)
-            if all_problems:
-                problem_counts = pd.Series(all_problems).value_counts().head(5)
-                for prob, count in problem_counts.items():
+            if not agg['problem_counts'].empty:
+                for prob, count in agg['problem_counts'].head(5).items():
                     story.append(Paragraph(f"- {prob} ({count})", styles['Normal']))
             else:
                 story.append(Paragraph("No problems detected.", styles['Normal']))
@@ -1,48 +1,191 @@
-import json
 import pandas as pd
+import pyarrow as pa
+from pyarrow import csv as pacsv
 import streamlit as st
 from typing import List, Dict, Any
+import codecs
+from contextlib import contextmanager
+import io
+import json
+import mmap
+import os
 import re
+from ratings import DEFAULT_RATING, parse_rating
+
+# orjson parses bytes directly and is several times faster than the stdlib
+# (the stdlib module stays imported for documents the fast parsers cannot represent)
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+# simdjson parses lazily, so only the fields we read become Python objects
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+# charset-normalizer guesses legacy encodings from byte statistics
+try:
+    from charset_normalizer import from_bytes
+except ImportError:
+    from_bytes = None
+
+# Every key normalize_review may read from a review object
+REVIEW_FIELDS = ('review_id', 'id', 'date', 'timestamp', 'rating', 'stars', 'score',
+                 'text', 'review', 'content')
+
+# Columns of the normalized review store returned by every ingest_* method
+REVIEW_COLUMNS = ('review_id', 'date', 'rating_text', 'text')
+
+# A digit run this long may be an integer wider than 64 bits, which orjson silently turns
+# into a float and simdjson rejects; such documents are parsed with the stdlib json module
+_WIDE_INT_RE = re.compile(rb'\d{19}')
+
+# Rows parsed per pandas chunk when streaming CSV uploads
+CSV_CHUNK_SIZE = 10_000
+
+# Bytes of a CSV upload inspected when guessing its encoding
+ENCODING_SNIFF_BYTES = 64 * 1024
+
+# Legacy encodings a non-UTF-8 CSV is matched against (Western exports from Excel and friends)
+LEGACY_ENCODINGS = ['cp1252', 'latin_1']
 
 class DataIngester:
     """Handles dynamic data ingestion from various file formats"""
     
-    def __init__(self):
+    def __init__(self, keep_raw=False):
         self.supported_formats = ['.json', '.csv', '.txt']
+        self.keep_raw = keep_raw
+
+    def new_columns(self):
+        """Empty column store (dict of lists) for normalized reviews"""
+        names = REVIEW_COLUMNS + (('raw_data',) if self.keep_raw else ())
+        return {name: [] for name in names}
+
+    def append_review(self, columns, review):
+        """Append one normalized review to a column store"""
+        for name, values in columns.items():
+            values.append(review[name])
     
+    @contextmanager
+    def read_bytes(self, uploaded_file):
+        """Whole upload as a bytes-like object; files on disk are memory-mapped for the with block"""
+        try:
+            fileno = uploaded_file.fileno()
+        except (AttributeError, OSError):
+            # In-memory uploads (Streamlit's UploadedFile, BytesIO) already hold the bytes
+            yield uploaded_file.getvalue()
+            return
+        if os.fstat(fileno).st_size == 0:
+            yield b''  # mmap cannot map an empty file
+            return
+        # The view is released before the mapping is closed
+        with mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+            yield view
+
+    def has_wide_ints(self, file_content):
+        """Whether a JSON document may hold integers too wide for the fast parsers"""
+        return _WIDE_INT_RE.search(file_content) is not None
+
     def safe_json_load(self, file_content):
         """Safely load JSON content with comprehensive error handling"""
         try:
-            return json.loads(file_content)
-        except json.JSONDecodeError as e:
+            if _json is json or self.has_wide_ints(file_content):
+                if isinstance(file_content, memoryview):
+                    file_content = bytes(file_content)  # the stdlib parser only takes bytes and str
+                return json.loads(file_content)
+            return _json.loads(file_content)
+        except ValueError as e:
             st.error(f"Invalid JSON format: {e}")
             return None
         except Exception as e:
             st.error(f"Error parsing JSON: {e}")
             return None
     
+    def read_csv_chunks(self, uploaded_file, **read_kwargs):
+        """Normalize CSV rows chunk by chunk so only one chunk is held as a DataFrame"""
+        uploaded_file.seek(0)
+        reviews = self.new_columns()
+        # Every cell comes back as a string and blanks as ''; na_filter=False skips NA detection entirely.
+        # index_col=False keeps rows with a trailing comma (Excel exports) aligned with the header
+        # Closing the reader explicitly (even when a chunk fails to decode) leaves the caller's
+        # buffer open for the next encoding attempt instead of to garbage collection
+        with pd.read_csv(uploaded_file, chunksize=CSV_CHUNK_SIZE, dtype=str,
+                         keep_default_na=False, na_filter=False, index_col=False, **read_kwargs) as chunks:
+            for chunk in chunks:
+                columns = list(chunk.columns)
+                # Running count rather than chunk.index, which need not be a RangeIndex
+                for row in chunk.itertuples(index=False, name=None):
+                    self.append_review(reviews, self.normalize_review(dict(zip(columns, row)), len(reviews['text'])))
+        return reviews
+
+    def read_csv_arrow(self, uploaded_file):
+        """Normalize UTF-8 CSV rows with pyarrow's C++ reader, one record batch at a time"""
+        # The first block gives the column names; re-open with every column typed as string
+        uploaded_file.seek(0)
+        column_names = pacsv.open_csv(uploaded_file).schema.names
+        uploaded_file.seek(0)
+        reader = pacsv.open_csv(uploaded_file, convert_options=pacsv.ConvertOptions(
+            column_types={name: pa.string() for name in column_names},
+            strings_can_be_null=False
+        ))
+
+        reviews = self.new_columns()
+        for batch in reader:
+            for record in batch.to_pylist():
+                self.append_review(reviews, self.normalize_review(record, len(reviews['text'])))
+        return reviews
+
+    def detect_encoding(self, uploaded_file):
+        """Guess a CSV upload's encoding from its BOM or first ENCODING_SNIFF_BYTES"""
+        uploaded_file.seek(0)
+        head = uploaded_file.read(ENCODING_SNIFF_BYTES)
+        uploaded_file.seek(0)
+
+        if head.startswith(codecs.BOM_UTF8):
+            return 'utf-8-sig'
+        try:
+            # Incremental decode tolerates a multi-byte character cut off at the end of the prefix
+            codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+            return 'utf-8'
+        except UnicodeDecodeError:
+            pass
+
+        if from_bytes is not None:
+            best = from_bytes(head, cp_isolation=LEGACY_ENCODINGS).best()
+            if best is not None:
+                return best.encoding
+        # latin-1 maps every byte, so it always decodes
+        return 'latin-1'
+
     def read_csv_with_encoding(self, uploaded_file):
-        """Read CSV file with multiple encoding attempts"""
-        encodings = ['utf-8', 'latin-1', 'iso-8859-1', 'cp1252', 'windows-1252']
-        
-        for encoding in encodings:
+        """Read CSV reviews in the detected encoding, parsing the file once"""
+        encoding = self.detect_encoding(uploaded_file)
+
+        # Fast path: pyarrow handles well-formed UTF-8 (and skips a UTF-8 BOM)
+        if encoding in ('utf-8', 'utf-8-sig'):
             try:
-                uploaded_file.seek(0)
-                df = pd.read_csv(uploaded_file, encoding=encoding)
+                reviews = self.read_csv_arrow(uploaded_file)
                 st.sidebar.success(f"Read with {encoding} encoding")
-                return df
-            except UnicodeDecodeError:
-                continue
-            except Exception as e:
-                st.error(f"Error with {encoding}: {e}")
-                continue
+                return reviews
+            except (pa.ArrowException, UnicodeDecodeError):
+                pass
+
+        try:
+            reviews = self.read_csv_chunks(uploaded_file, encoding=encoding)
+            st.sidebar.success(f"Read with {encoding} encoding")
+            return reviews
+        except UnicodeDecodeError:
+            pass
+        except Exception as e:
+            st.error(f"Error with {encoding}: {e}")
         
-        # Final attempt with error handling
+        # Final attempt with error handling, for files that only look like the detected encoding
         try:
-            uploaded_file.seek(0)
-            df = pd.read_csv(uploaded_file, encoding='utf-8', errors='replace')
+            reviews = self.read_csv_chunks(uploaded_file, encoding=encoding, encoding_errors='replace')
             st.sidebar.warning("Used error replacement for problematic characters")
-            return df
+            return reviews
         except Exception as e:
             st.error(f"Final CSV read attempt failed: {e}")
             return None
@@ -50,157 +193,184 @@ class DataIngester:
     def extract_rating_from_text(self, rating_text):
         """Extract numeric rating from various rating formats"""
         if not rating_text or pd.isna(rating_text):
-            return 3
-        
-        rating_str = str(rating_text).lower()
-        
-        # Extract from patterns like "★★★☆☆ (3 stars)"
-        star_match = re.search(r'\((\d+)\s*stars?\)', rating_str)
-        if star_match:
-            return int(star_match.group(1))
-        
-        # Count stars ★
-        star_count = rating_str.count('★')
-        if star_count > 0:
-            return star_count
-        
-        # Count asterisks *
-        asterisk_count = rating_str.count('*')
-        if asterisk_count > 0:
-            return asterisk_count
-        
-        # Try to extract numeric value
-        num_match = re.search(r'(\d+(?:\.\d+)?)/?(\d+)?', rating_str)
-        if num_match:
-            numerator = float(num_match.group(1))
-            if num_match.group(2):  # If denominator exists (e.g., 4/5)
-                denominator = float(num_match.group(2))
-                return (numerator / denominator) * 5
-            return min(numerator, 5)  # Cap at 5
-        
-        return 3  # Default neutral rating
+            return DEFAULT_RATING
+        return parse_rating(str(rating_text))
     
+    def field_text(self, record, keys, default=''):
+        """First of keys present with a non-null value, as a string; JSON null counts as missing"""
+        for key in keys:
+            value = record.get(key)
+            if value is not None:
+                return str(value)
+        return default
+
     def normalize_review(self, raw_data, index):
         """Normalize various review formats to standard structure"""
         try:
             if isinstance(raw_data, dict):
                 # Handle dictionary format
-                return {
-                    'review_id': str(raw_data.get('review_id', raw_data.get('id', f'R{index:05d}'))),
-                    'date': str(raw_data.get('date', raw_data.get('timestamp', ''))),
-                    'rating_text': str(raw_data.get('rating', raw_data.get('stars', raw_data.get('score', '')))),
-                    'text': str(raw_data.get('text', raw_data.get('review', raw_data.get('content', '')))),
-                    'raw_data': raw_data
+                review = {
+                    'review_id': self.field_text(raw_data, ('review_id', 'id'), f'R{index:05d}'),
+                    'date': self.field_text(raw_data, ('date', 'timestamp')),
+                    'rating_text': self.field_text(raw_data, ('rating', 'stars', 'score')),
+                    'text': self.field_text(raw_data, ('text', 'review', 'content'))
                 }
             elif isinstance(raw_data, str):
                 # Handle plain text reviews
-                return {
+                review = {
                     'review_id': f'R{index:05d}',
                     'date': '',
                     'rating_text': '',
-                    'text': raw_data,
-                    'raw_data': raw_data
+                    'text': raw_data
                 }
             else:
                 # Handle other formats
-                return {
+                review = {
                     'review_id': f'R{index:05d}',
                     'date': '',
                     'rating_text': '',
-                    'text': str(raw_data),
-                    'raw_data': raw_data
+                    'text': str(raw_data)
                 }
         except Exception as e:
-            return {
+            review = {
                 'review_id': f'R{index:05d}',
                 'date': '',
                 'rating_text': '',
-                'text': f'Error processing: {e}',
-                'raw_data': raw_data
+                'text': f'Error processing: {e}'
             }
+
+        # The original record is only carried along on request; nothing downstream reads it
+        if self.keep_raw:
+            review['raw_data'] = raw_data
+        return review
     
     def ingest_json(self, uploaded_file):
         """Ingest and parse JSON files"""
         try:
-            content = uploaded_file.getvalue().decode('utf-8')
-            data = self.safe_json_load(content)
+            # Both parsers accept raw bytes, so skip the full UTF-8 decode copy
+            with self.read_bytes(uploaded_file) as content:
+                data = self.safe_json_load(content)
             
+            reviews = self.new_columns()
             if not data:
-                return []
-            
-            reviews = []
+                return reviews
             
             # Handle different JSON structures
             if isinstance(data, list):
                 for i, item in enumerate(data):
                     normalized = self.normalize_review(item, i)
-                    reviews.append(normalized)
+                    self.append_review(reviews, normalized)
             elif isinstance(data, dict):
                 if 'reviews' in data and isinstance(data['reviews'], list):
                     for i, item in enumerate(data['reviews']):
                         normalized = self.normalize_review(item, i)
-                        reviews.append(normalized)
+                        self.append_review(reviews, normalized)
                 else:
                     normalized = self.normalize_review(data, 0)
-                    reviews.append(normalized)
+                    self.append_review(reviews, normalized)
             
             return reviews
             
         except Exception as e:
             st.error(f"JSON ingestion error: {e}")
-            return []
+            return self.new_columns()
     
+    def project_simdjson_review(self, item):
+        """Copy just the review fields out of a simdjson proxy into plain Python objects"""
+        if isinstance(item, simdjson.Array):
+            return item.as_list()
+        if not isinstance(item, simdjson.Object):
+            return item
+
+        projected = {}
+        for key in REVIEW_FIELDS:
+            if key in item:
+                value = item[key]
+                if isinstance(value, simdjson.Object):
+                    value = value.as_dict()
+                elif isinstance(value, simdjson.Array):
+                    value = value.as_list()
+                projected[key] = value
+        return projected
+
+    def ingest_json_simdjson(self, uploaded_file):
+        """Ingest JSON files with simdjson's lazy parser"""
+        try:
+            # One parser per call: a parser's documents die when it parses again.
+            # simdjson copies the input, so the upload can be unmapped right after parsing
+            try:
+                with self.read_bytes(uploaded_file) as content:
+                    doc = simdjson.Parser().parse(content)
+            except ValueError as e:
+                st.error(f"Invalid JSON format: {e}")
+                return self.new_columns()
+
+            if isinstance(doc, simdjson.Array):
+                items = doc
+            elif isinstance(doc, simdjson.Object) and len(doc):
+                nested = doc.get('reviews')
+                items = nested if isinstance(nested, simdjson.Array) else [doc]
+            else:
+                return self.new_columns()
+
+            # Fields are materialized here, so nothing references the parser afterwards
+            reviews = self.new_columns()
+            for i, item in enumerate(items):
+                self.append_review(reviews, self.normalize_review(self.project_simdjson_review(item), i))
+            return reviews
+
+        except Exception as e:
+            st.error(f"JSON ingestion error: {e}")
+            return self.new_columns()
+
     def ingest_csv(self, uploaded_file):
         """Ingest and parse CSV files"""
         try:
-            df = self.read_csv_with_encoding(uploaded_file)
-            if df is None:
-                return []
-            
-            reviews = []
-            for i, row in df.iterrows():
-                review_dict = {}
-                for col in df.columns:
-                    value = row[col]
-                    review_dict[col] = '' if pd.isna(value) else str(value)
-                
-                normalized = self.normalize_review(review_dict, i)
-                reviews.append(normalized)
-            
-            return reviews
+            reviews = self.read_csv_with_encoding(uploaded_file)
+            return reviews if reviews is not None else self.new_columns()
             
         except Exception as e:
             st.error(f"CSV ingestion error: {e}")
-            return []
+            return self.new_columns()
     
     def ingest_text(self, uploaded_file):
         """Ingest plain text files"""
         try:
-            content = uploaded_file.getvalue().decode('utf-8')
-            reviews = []
+            reviews = self.new_columns()
             
-            # Split by lines or paragraphs
-            lines = content.split('\n')
-            for i, line in enumerate(lines):
-                if line.strip():  # Only non-empty lines
-                    normalized = self.normalize_review(line.strip(), i)
-                    reviews.append(normalized)
+            # Decode line by line off the buffer instead of holding the whole text and a list of lines
+            uploaded_file.seek(0)
+            lines = io.TextIOWrapper(uploaded_file, encoding='utf-8', errors='replace', newline='\n')
+            try:
+                for i, line in enumerate(lines):
+                    line = line.strip()
+                    if line:  # Only non-empty lines
+                        normalized = self.normalize_review(line, i)
+                        self.append_review(reviews, normalized)
+            finally:
+                # Detach so closing the wrapper does not close the caller's file
+                lines.detach()
             
             return reviews
             
         except Exception as e:
             st.error(f"Text file ingestion error: {e}")
-            return []
+            return self.new_columns()
     
     def ingest_file(self, uploaded_file):
-        """Main ingestion method"""
+        """Main ingestion method; returns normalized reviews as a dict of column lists"""
         if uploaded_file is None:
-            return []
+            return self.new_columns()
         
         filename = uploaded_file.name.lower()
         
         try:
             if filename.endswith('.json'):
+                if simdjson is not None:
+                    with self.read_bytes(uploaded_file) as content:
+                        use_simdjson = not self.has_wide_ints(content)
+                    if use_simdjson:
+                        return self.ingest_json_simdjson(uploaded_file)
                 return self.ingest_json(uploaded_file)
             elif filename.endswith('.csv'):
                 return self.ingest_csv(uploaded_file)
@@ -208,8 +378,8 @@ class DataIngester:
                 return self.ingest_text(uploaded_file)
             else:
                 st.error(f"Unsupported file format: {filename}")
-                return []
+                return self.new_columns()
                 
         except Exception as e:
             st.error(f"File ingestion failed: {e}")
-            return []
\ No newline at end of file
+            return self.new_columns()
\ No newline at end of file
@@ -0,0 +1,48 @@
+import re
+
+# Rating used when a value cannot be parsed: the middle of the 1-5 scale
+DEFAULT_RATING = 3
+# Parsed numbers are capped at the top of the scale
+MAX_RATING = 5
+
+# Number in parentheses, e.g. "★★★☆☆ (3 stars)"
+_STAR_PAREN_RE = re.compile(r'\((\d+)')
+# Score out of a maximum, e.g. "4/5", "8/10" or "4 out of 5"
+_FRACTION_RE = re.compile(r'(\d+(?:\.\d+)?)\s*(?:/|out of)\s*(\d+)', re.IGNORECASE)
+# Any other number, e.g. "4 stars" or "rated 4.5"
+_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+
+def parse_rating(rating_str: str):
+    """Extract a numeric rating from the rating formats found in review exports"""
+    # Try to extract number from parentheses (e.g., "★★★☆☆ (3 stars)" -> 3)
+    number_match = _STAR_PAREN_RE.search(rating_str)
+    if number_match:
+        return int(number_match.group(1))
+
+    # Try to count stars
+    star_count = rating_str.count('★')
+    if star_count > 0:
+        return star_count
+
+    # Try to parse as float
+    try:
+        return min(float(rating_str), MAX_RATING)
+    except ValueError:
+        pass
+
+    # Count asterisks (e.g., "****")
+    asterisk_count = rating_str.count('*')
+    if asterisk_count > 0:
+        return asterisk_count
+
+    # Scale fractions to five stars (e.g., "8/10" -> 4.0)
+    fraction_match = _FRACTION_RE.search(rating_str)
+    if fraction_match and int(fraction_match.group(2)):
+        return min(float(fraction_match.group(1)) / int(fraction_match.group(2)) * 5, MAX_RATING)
+
+    # First number anywhere (e.g., "4 stars" -> 4.0)
+    number_match = _NUMBER_RE.search(rating_str)
+    if number_match:
+        return min(float(number_match.group()), MAX_RATING)
+
+    return DEFAULT_RATING
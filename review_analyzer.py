@@ -1,7 +1,38 @@
+import multiprocessing
+import os
 import re
-from textblob import TextBlob
-from typing import Dict, Any, List
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+# TextBlob's default PatternAnalyzer scorer, called without building a TextBlob per review
+from textblob.en import sentiment as pattern_sentiment
+from typing import Dict, Any, Iterable, List, Union
+import numpy as np
 import pandas as pd
+from ratings import DEFAULT_RATING, parse_rating
+
+# Word-count bounds for the "short" and "medium" length categories
+SHORT_MAX_WORDS = 20
+MEDIUM_MAX_WORDS = 100
+
+# Length bounds (characters) of the text captured after a suggestion lead
+SUGGESTION_MIN_CHARS = 4
+SUGGESTION_MAX_CHARS = 120
+
+# Each worker is a fresh interpreter that imports TextBlob and pandas (about 0.7s), and
+# a review takes about 0.12ms serially; below this many distinct texts the pool is slower
+PARALLEL_MIN_TEXTS = 25_000
+
+# Never fork() workers from Streamlit's multi-threaded server; start them from a
+# forkserver where the platform has one, otherwise spawn (macOS and Windows behave alike)
+_POOL_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+)
+
+# Aho-Corasick finds every keyword in one pass over the text (pip install pyahocorasick)
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
 class ReviewAnalyzer:
     """
@@ -9,20 +40,10 @@ class ReviewAnalyzer:
     """
     
     def __init__(self):
-        self.suggestion_patterns = [
-            r"please ([\w\s]+)",
-            r"they should ([\w\s]+)", 
-            r"you should ([\w\s]+)",
-            r"we should ([\w\s]+)",
-            r"add ([\w\s]+)",
-            r"implement ([\w\s]+)",
-            r"improve ([\w\s]+)",
-            r"make ([\w\s]+)",
-            r"fix ([\w\s]+)",
-            r"i suggest ([\w\s]+)",
-            r"it would be great if ([\w\s]+)",
-            r"can you ([\w\s]+)",
-            r"could you ([\w\s]+)"
+        self.suggestion_leads = [
+            "please", "they should", "you should", "we should",
+            "add", "implement", "improve", "make", "fix",
+            "i suggest", "it would be great if", "can you", "could you"
         ]
         
         self.problem_keywords = [
@@ -41,6 +62,46 @@ class ReviewAnalyzer:
             'mobile', 'customer', 'experience', 'package', 'item'
         ]
 
+        # Compile every pattern once instead of on each review
+        # All suggestion leads fused into one alternation so the text is scanned once;
+        # the bounded capture keeps a long unpunctuated review from becoming one suggestion
+        self._suggestion_re = re.compile(
+            r'\b(?:' + '|'.join(re.escape(lead) for lead in self.suggestion_leads) + r')'
+            rf'\s+([\w\s]{{{SUGGESTION_MIN_CHARS},{SUGGESTION_MAX_CHARS}}}?)(?:[^\w\s]|$)'
+        )
+        self._sentence_split_re = re.compile(r'[.!?]')
+
+        self.topic_phrases = [
+            'discount program', 'search functionality',
+            'delivery time', 'customer support',
+            'user interface', 'checkout process',
+            'food quality', 'order accuracy',
+            'mobile app', 'website design',
+            'payment process', 'shipping speed'
+        ]
+
+        # (needle, label) pairs built once instead of per review
+        self._topic_matchers = (
+            [(keyword, keyword.capitalize()) for keyword in self.topic_keywords] +
+            [(phrase, phrase.title()) for phrase in self.topic_phrases]
+        )
+
+        self._problem_ac = None
+        self._topic_ac = None
+        if ahocorasick is not None:
+            self._problem_ac = self.build_automaton(
+                (keyword, keyword) for keyword in self.problem_keywords
+            )
+            self._topic_ac = self.build_automaton(self._topic_matchers)
+
+    def build_automaton(self, matchers):
+        """Build an Aho-Corasick automaton mapping each needle to its label"""
+        automaton = ahocorasick.Automaton()
+        for needle, label in matchers:
+            automaton.add_word(needle, label)
+        automaton.make_automaton()
+        return automaton
+
     def safe_string_conversion(self, value):
         """Safely convert any value to string"""
         if value is None:
@@ -61,8 +122,7 @@ class ReviewAnalyzer:
             if not clean_text.strip():
                 return "neutral"
                 
-            analysis = TextBlob(clean_text)
-            polarity = analysis.sentiment.polarity
+            polarity, _ = pattern_sentiment(clean_text)
             
             if polarity > 0.2:
                 return "positive"
@@ -74,81 +134,73 @@ class ReviewAnalyzer:
             print(f"Sentiment analysis error: {e}")
             return "neutral"
 
-    def extract_suggestions(self, text: str) -> List[str]:
+    def extract_suggestions(self, text: str, lowered: bool = False) -> List[str]:
         """Extract suggestions using regex patterns"""
-        suggestions = []
         try:
-            clean_text = self.safe_string_conversion(text).lower()
+            clean_text = self.safe_string_conversion(text)
+            if not lowered:
+                clean_text = clean_text.lower()
             if not clean_text.strip():
                 return []
                 
-            for pattern in self.suggestion_patterns:
-                matches = re.finditer(pattern, clean_text)
-                for match in matches:
-                    suggestion = match.group(1).strip()
-                    if suggestion and len(suggestion) > 3:  # Minimum length
-                        suggestions.append(suggestion.capitalize())
-            return list(set(suggestions))  # Remove duplicates
+            matches = (match.group(1).strip() for match in self._suggestion_re.finditer(clean_text))
+            # Ordered dedup, then capitalize each distinct suggestion once
+            return [suggestion.capitalize() for suggestion in dict.fromkeys(matches)
+                    if len(suggestion) > 3]  # Minimum length
         except Exception as e:
             print(f"Suggestion extraction error: {e}")
             return []
 
-    def extract_problems(self, text: str) -> List[str]:
+    def extract_problems(self, text: str, lowered: bool = False) -> List[str]:
         """Extract problems using keyword matching"""
         problems = []
         try:
-            clean_text = self.safe_string_conversion(text).lower()
+            clean_text = self.safe_string_conversion(text)
+            if not lowered:
+                clean_text = clean_text.lower()
             if not clean_text.strip():
                 return []
                 
-            sentences = re.split(r'[.!?]', clean_text)
+            sentences = self._sentence_split_re.split(clean_text)
             
             for sentence in sentences:
                 sentence = sentence.strip()
                 if not sentence:
                     continue
                     
-                for keyword in self.problem_keywords:
-                    if keyword in sentence:
-                        # Clean up and capitalize the sentence
-                        clean_sentence = sentence.capitalize()
-                        if clean_sentence not in problems:
-                            problems.append(clean_sentence)
-                        break
+                if self._problem_ac is not None:
+                    has_problem = next(self._problem_ac.iter(sentence), None) is not None
+                else:
+                    has_problem = any(keyword in sentence for keyword in self.problem_keywords)
+
+                if has_problem:
+                    # Clean up and capitalize the sentence
+                    clean_sentence = sentence.capitalize()
+                    if clean_sentence not in problems:
+                        problems.append(clean_sentence)
             
             return problems[:5]  # Return max 5 problems
         except Exception as e:
             print(f"Problem extraction error: {e}")
             return []
 
-    def extract_topics(self, text: str) -> List[str]:
+    def extract_topics(self, text: str, lowered: bool = False) -> List[str]:
         """Extract topics using keyword matching"""
-        topics = set()
         try:
-            clean_text = self.safe_string_conversion(text).lower()
+            clean_text = self.safe_string_conversion(text)
+            if not lowered:
+                clean_text = clean_text.lower()
             if not clean_text.strip():
                 return []
                 
-            # Check for single keywords
-            for keyword in self.topic_keywords:
-                if keyword in clean_text:
-                    topics.add(keyword.capitalize())
-            
-            # Check for common phrases
-            common_phrases = [
-                'discount program', 'search functionality', 
-                'delivery time', 'customer support',
-                'user interface', 'checkout process',
-                'food quality', 'order accuracy',
-                'mobile app', 'website design',
-                'payment process', 'shipping speed'
-            ]
-            
-            for phrase in common_phrases:
-                if phrase in clean_text:
-                    topics.add(phrase.title())
-            
-            return sorted(list(topics))
+            # Check for single keywords and common phrases
+            if self._topic_ac is not None:
+                topics = {label for _, label in self._topic_ac.iter(clean_text)}
+            else:
+                topics = {label for needle, label in self._topic_matchers if needle in clean_text}
+
+            # Sorted so the order does not depend on which matcher ran
+            return sorted(topics)
         except Exception as e:
             print(f"Topic extraction error: {e}")
             return []
@@ -156,100 +208,180 @@ class ReviewAnalyzer:
     def extract_rating(self, rating_value):
         """Extract numeric rating from various formats"""
         try:
-            rating_str = self.safe_string_conversion(rating_value)
-            
-            # Try to extract number from parentheses (e.g., "★★★☆☆ (3 stars)" -> 3)
-            import re
-            number_match = re.search(r'\((\d+)', rating_str)
-            if number_match:
-                return int(number_match.group(1))
-            
-            # Try to count stars
-            star_count = rating_str.count('★')
-            if star_count > 0:
-                return star_count
-            
-            # Try to parse as float
-            try:
-                return float(rating_str)
-            except:
-                pass
-                
-            # Default to 3 if cannot parse
-            return 3
-        except:
-            return 3
+            return parse_rating(self.safe_string_conversion(rating_value))
+        except Exception:
+            return DEFAULT_RATING
 
-    def analyze_review_text(self, review_text: str, review_data: Dict = None) -> Dict[str, Any]:
+    def get_length_category(self, word_count: int) -> str:
+        """Bucket a review by its word count"""
+        if word_count < SHORT_MAX_WORDS:
+            return "short"
+        elif word_count < MEDIUM_MAX_WORDS:
+            return "medium"
+        return "long"
+
+    def add_length_features(self, insights: Dict[str, Any], text: str) -> Dict[str, Any]:
+        """Add character/word counts and length category for one review"""
+        word_count = len(text.split())
+        insights["char_count"] = len(text)
+        insights["word_count"] = word_count
+        insights["length_category"] = self.get_length_category(word_count)
+        return insights
+
+    def analyze_review_text(self, review_text: str, review_data: Dict = None,
+                            include_counts: bool = True) -> Dict[str, Any]:
         """
         Analyze review text with comprehensive error handling
+
+        analyze_batch passes include_counts=False and computes the length
+        features for the whole column at once.
         """
         try:
             # Perform analysis
             sentiment = self.analyze_sentiment(review_text)
-            topics = self.extract_topics(review_text)
-            problems = self.extract_problems(review_text)
-            suggestions = self.extract_suggestions(review_text)
+            # Lowercase once for all three keyword/pattern extractors
+            lower_text = self.safe_string_conversion(review_text).lower()
+            topics = self.extract_topics(lower_text, lowered=True)
+            problems = self.extract_problems(lower_text, lowered=True)
+            suggestions = self.extract_suggestions(lower_text, lowered=True)
             
-            # Extract rating if review_data is provided
-            numeric_rating = 3
-            if review_data and isinstance(review_data, dict):
-                rating_value = review_data.get('rating', '')
-                numeric_rating = self.extract_rating(rating_value)
+            rating_num = self.get_review_rating(review_data)
 
-            return {
+            insights = {
                 "sentiment": sentiment,
                 "topics": topics,
                 "problems": problems,
                 "suggestions": suggestions,
-                "numeric_rating": numeric_rating,
-                "character_count": len(review_text),
-                "word_count": len(review_text.split()),
+                "rating_num": rating_num,
+                "has_rating": rating_num is not None,
                 "analysis_success": True
             }
+            if include_counts:
+                self.add_length_features(insights, review_text)
+            return insights
         except Exception as e:
             print(f"Review analysis failed: {e}")
-            return self.get_default_insights(review_text)
+            return self.get_default_insights(review_text, include_counts)
 
-    def get_default_insights(self, text=""):
+    def get_default_insights(self, text="", include_counts=True):
         """Return default insights when analysis fails"""
-        text_str = self.safe_string_conversion(text)
-        return {
+        insights = {
             "sentiment": "neutral",
             "topics": [],
             "problems": [],
             "suggestions": [],
-            "numeric_rating": 3,
-            "character_count": len(text_str),
-            "word_count": len(text_str.split()),
+            "rating_num": None,
+            "has_rating": False,
             "analysis_success": False
         }
+        if include_counts:
+            self.add_length_features(insights, self.safe_string_conversion(text))
+        return insights
 
-    def analyze_batch(self, reviews_data: List[Dict]) -> pd.DataFrame:
-        """Analyze a batch of reviews and return DataFrame"""
-        analyzed_reviews = []
-        
+    def get_review_rating(self, review_data: Dict = None):
+        """Numeric rating of a review, or None when it has no rating"""
+        if review_data and isinstance(review_data, dict):
+            rating_value = self.get_rating_text(review_data)
+            if rating_value.strip():
+                return self.extract_rating(rating_value)
+        return None
+
+    def get_rating_text(self, review: Dict) -> str:
+        """Raw rating string from a normalized (rating_text) or raw (rating) review"""
+        return self.safe_string_conversion(review.get('rating_text', review.get('rating', '')))
+
+    def to_columns(self, reviews_data: Iterable[Dict]) -> Dict[str, List[str]]:
+        """Convert review dicts (normalized or raw) into DataIngester's column layout"""
+        columns = {'review_id': [], 'date': [], 'rating_text': [], 'text': []}
         for i, review in enumerate(reviews_data):
             # Ensure review is a dictionary
             if not isinstance(review, dict):
                 print(f"Warning: Review {i} is not a dictionary: {review}")
                 continue
-                
-            # Extract text safely
-            review_text = self.safe_string_conversion(
+
+            columns['review_id'].append(self.safe_string_conversion(review.get('review_id', review.get('id', f'R{i:05d}'))))
+            columns['date'].append(self.safe_string_conversion(review.get('date', review.get('timestamp', ''))))
+            columns['rating_text'].append(self.get_rating_text(review))
+            columns['text'].append(self.safe_string_conversion(
                 review.get('text', review.get('review', review.get('content', '')))
-            )
-            
-            insights = self.analyze_review_text(review_text, review)
-            
-            # Create combined result
-            result = {
-                'review_id': self.safe_string_conversion(review.get('review_id', review.get('id', f'R{i:05d}'))),
-                'date': self.safe_string_conversion(review.get('date', review.get('timestamp', ''))),
-                'original_rating': self.safe_string_conversion(review.get('rating', '')),
-                'text': review_text,
-                **insights
-            }
-            analyzed_reviews.append(result)
-        
-        return pd.DataFrame(analyzed_reviews)
\ No newline at end of file
+            ))
+        return columns
+
+    def analyze_texts(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """Text-derived insights (no rating or length features) for each text"""
+        return [self.analyze_review_text(text, include_counts=False) for text in texts]
+
+    def analyze_texts_parallel(self, texts: List[str], n_jobs: int) -> List[Dict[str, Any]]:
+        """analyze_texts split into one contiguous slice per worker process"""
+        chunk_size = -(-len(texts) // n_jobs)
+        chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=_POOL_CONTEXT) as executor:
+            return list(chain.from_iterable(executor.map(analyze_chunk, chunks)))
+
+    def analyze_batch(self, reviews_data: Union[Dict[str, List[str]], Iterable[Dict]],
+                      n_jobs: int = None) -> pd.DataFrame:
+        """
+        Analyze a batch of reviews and return DataFrame
+
+        Takes the column dict returned by DataIngester (review_id, date,
+        rating_text and text lists) or any iterable of review dicts.
+        Batches of PARALLEL_MIN_TEXTS or more distinct texts are analyzed
+        across n_jobs processes (default: one per CPU; 1 disables it).
+        """
+        if isinstance(reviews_data, dict):
+            columns = reviews_data
+        else:
+            columns = self.to_columns(reviews_data)
+
+        texts = columns['text']
+        if not texts:
+            return pd.DataFrame()
+
+        # Text-derived insights per distinct text; duplicate reviews are analyzed once
+        unique_texts = list(dict.fromkeys(texts))
+        n_jobs = n_jobs or os.cpu_count() or 1
+        if n_jobs > 1 and len(unique_texts) >= PARALLEL_MIN_TEXTS:
+            unique_insights = self.analyze_texts_parallel(unique_texts, n_jobs)
+        else:
+            unique_insights = self.analyze_texts(unique_texts)
+        text_insights = dict(zip(unique_texts, unique_insights))
+        insights = [text_insights[text] for text in texts]
+
+        # Ratings differ between reviews with the same text, so they are never cached
+        rating_nums = [self.extract_rating(rating) if rating.strip() else None
+                       for rating in columns['rating_text']]
+
+        # Built column by column; no per-review result dicts
+        df = pd.DataFrame({
+            'review_id': columns['review_id'],
+            'date': columns['date'],
+            'rating_text': columns['rating_text'],
+            'text': texts,
+            'sentiment': [item['sentiment'] for item in insights],
+            'topics': [item['topics'] for item in insights],
+            'problems': [item['problems'] for item in insights],
+            'suggestions': [item['suggestions'] for item in insights],
+            'rating_num': rating_nums,
+            'has_rating': [rating is not None for rating in rating_nums],
+            'analysis_success': [item['analysis_success'] for item in insights]
+        })
+
+        # Length features for the whole column at once
+        text_ser = df['text']
+        df['char_count'] = text_ser.str.len()
+        df['word_count'] = text_ser.str.split().str.len()
+        df['length_category'] = np.select(
+            [df['word_count'] < SHORT_MAX_WORDS, df['word_count'] < MEDIUM_MAX_WORDS],
+            ["short", "medium"],
+            default="long"
+        )
+        return df
+
+_worker_analyzer = None
+
+def analyze_chunk(texts: List[str]) -> List[Dict[str, Any]]:
+    """Analyze one slice of texts inside a worker process (one analyzer per worker)"""
+    global _worker_analyzer
+    if _worker_analyzer is None:
+        _worker_analyzer = ReviewAnalyzer()
+    return _worker_analyzer.analyze_texts(texts)
\ No newline at end of file